@@ -0,0 +1,127 @@
+from core import ENGINES, POSSIBLE_BLKS, bitreps_measure, bytes_to_blocks, dir_setup
+import argparse
+
+
+class ConsoleBar:
+    """
+    Console progress bar exposing the same setValue interface as the GUI's QProgressBar
+    """
+    def __init__(self):
+        from tqdm import tqdm                           # Optional dependency, only needed when measuring
+        self.bar = tqdm(total=100)
+
+    def setValue(self, value):
+        self.bar.update(int(value) - self.bar.n)
+        if int(value) >= 100:
+            self.bar.close()
+
+
+def measure(args):
+    """
+    Perform BitReps measurements for an input file
+    :param args: Parsed arguments of the measure subcommand
+    :return: None
+    """
+    segment_size = bytes_to_blocks(args.segment, args.blocksize, args.sliding) if args.segment else 0
+    bitreps_measure(args.input, args.blocksize, ConsoleBar(), args.sliding, args.err_rate, segment_size, args.engine)
+
+
+def analyse(args):
+    """
+    Analyse a BitReps JSON file against a model and print the results
+    :param args: Parsed arguments of the analyse subcommand
+    :return: Exit code 1 if the model does not match the input, otherwise None
+    """
+    from processor import summarise
+
+    try:
+        summary = summarise(args.input, args.model)
+    except ValueError as err:
+        print(err)
+        return 1
+    for k, v in summary.items():
+        print("%s: %s" % (k, v))
+
+
+def generate(args):
+    """
+    Generate a model from parallel baseline runs and print its path
+    :param args: Parsed arguments of the generate subcommand
+    :return: Exit code 1 if the parameters are invalid, otherwise None
+    """
+    from model import DEFAULT_RUNS, generate_model
+
+    try:
+        model_path = generate_model(args.blocksize, args.err_rate, args.num_blocks, args.runs or DEFAULT_RUNS,
+                                    args.source, args.seed, args.workers, engine=args.engine)
+    except ValueError as err:
+        print(err)
+        return 1
+    print(model_path)
+
+
+def index(args):
+    """
+    Add a file to, or query a file against, the cross-file block index and print the shared segments
+    :param args: Parsed arguments of the index subcommand
+    :return: Exit code 1 if the file cannot be added or queried, otherwise None
+    """
+    from corpus import add_file, query_file
+
+    try:
+        if args.action == "add":
+            collisions = add_file(args.input, args.blocksize, force=args.force)
+        else:
+            collisions = query_file(args.input, args.blocksize, force=args.force)
+    except ValueError as err:
+        print(err)
+        return 1
+    for path, segments in collisions.items():
+        print("%s: %s shared segments covering %s blocks, first at offset %s (offset %s in that file, %s blocks)" % (
+            path, len(segments), segments[:, 2].sum(), segments[0][0], segments[0][1], segments[0][2]))
+
+
+def main(argv):
+    """
+    Run BitReps from the command line without loading the GUI
+    :param argv: Command line arguments
+    :return: Exit code
+    """
+    parser = argparse.ArgumentParser(prog="bitreps")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("measure", help="Perform BitReps measurements for an input file")
+    p.add_argument("input")
+    p.add_argument("-b", "--blocksize", type=int, choices=POSSIBLE_BLKS, required=True)
+    p.add_argument("-e", "--err-rate", type=float, required=True)
+    p.add_argument("-s", "--segment", type=int, default=0, help="Segment size in bytes for the segment profile")
+    p.add_argument("--sliding", action="store_true", help="Use a sliding window")
+    p.add_argument("--engine", choices=sorted(ENGINES), default="bloom")
+    p.set_defaults(func=measure)
+
+    p = sub.add_parser("analyse", help="Analyse a BitReps JSON file against a model")
+    p.add_argument("input")
+    p.add_argument("model")
+    p.set_defaults(func=analyse)
+
+    p = sub.add_parser("generate", help="Generate a model from parallel baseline runs")
+    p.add_argument("-b", "--blocksize", type=int, choices=POSSIBLE_BLKS, required=True)
+    p.add_argument("-e", "--err-rate", type=float, required=True)
+    p.add_argument("-n", "--num-blocks", type=int, required=True)
+    p.add_argument("-r", "--runs", type=int, default=None, help="Number of baseline runs (defaults to 100)")
+    p.add_argument("--source", choices=["urandom", "csprng"], default="urandom")
+    p.add_argument("--seed", type=int, default=0)
+    p.add_argument("-w", "--workers", type=int, default=None)
+    p.add_argument("--engine", choices=sorted(ENGINES), default="bloom")
+    p.set_defaults(func=generate)
+
+    p = sub.add_parser("index", help="Add a file to, or query a file against, the cross-file block index")
+    p.add_argument("action", choices=["add", "query"])
+    p.add_argument("input")
+    p.add_argument("-b", "--blocksize", type=int, choices=POSSIBLE_BLKS, required=True)
+    p.add_argument("-f", "--force", action="store_true", help="Run even if chance collisions are expected")
+    p.set_defaults(func=index)
+
+    args = parser.parse_args(argv[1:])
+    dir_setup()
+    return args.func(args) or 0
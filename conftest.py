@@ -0,0 +1,13 @@
+from core import dir_setup
+import pytest
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """
+    Run a test inside a fresh working directory, as BitReps reads and writes relative to the current directory
+    :return: Path of the working directory
+    """
+    monkeypatch.chdir(tmp_path)
+    dir_setup()
+    return tmp_path
@@ -0,0 +1,323 @@
+from collections import defaultdict
+from math import floor, e
+import importlib
+import json
+import os
+
+
+INPUT_DIR = os.path.join(".", "input")                  # Directory for RNG output
+OUTPUT_DIR = os.path.join(".", "output")                # Directory for BitReps JSON
+RESULTS_DIR = os.path.join(".", "results")              # Directory for BitReps analysis results
+MODEL_DIR = os.path.join(".", "model")                  # Directory for baseline chi-square distribution
+INDEX_DIR = os.path.join(".", "index")                  # Directory for persistent cross-file block indexes
+POSSIBLE_BLKS = [8, 16, 32, 64, 128, 256, 512]          # Supported blocksizes for BitReps
+STREAM_BLOCKS = 65536                                   # Blocks requested from a byte stream at a time
+
+# Backends are registered as "module:attribute" and only imported once selected, so that importing core (e.g. in a
+# short-lived worker process) never pulls in bloom_filter2, PyQt5 or any other optional dependency
+ENGINES = {                                             # Set-membership engines used to detect repetitions
+    "bloom": "engines:BloomEngine",
+    "exact": "engines:ExactEngine",
+    "sketch": "engines:SketchEngine"
+}
+FRONTENDS = {                                           # User interfaces, selected from main.py
+    "gui": "gui:main",
+    "cli": "cli:main"
+}
+
+
+def register_backend(registry, name, target):
+    """
+    Register a backend to be loaded on demand
+    :param registry: ENGINES or FRONTENDS
+    :param name: Name used to select the backend
+    :param target: Location of the backend, as "module:attribute"
+    :return: None
+    """
+    registry[name] = target
+
+
+def load_backend(registry, name):
+    """
+    Import and return a registered backend
+    :param registry: ENGINES or FRONTENDS
+    :param name: Name of the backend
+    :return: The backend's class or function
+    """
+    if name not in registry:
+        raise ValueError("Unknown backend %s! Must be one of %s." % (name, sorted(registry)))
+    module, attr = registry[name].split(":")
+    return getattr(importlib.import_module(module), attr)
+
+
+def dir_setup():
+    """
+    Create the directories necessary for BitReps operation, if necessary
+    :return: None
+    """
+    if not os.path.isdir(OUTPUT_DIR):
+        os.mkdir(OUTPUT_DIR)
+    if not os.path.isdir(RESULTS_DIR):
+        os.mkdir(RESULTS_DIR)
+    if not os.path.isdir(MODEL_DIR):
+        os.mkdir(MODEL_DIR)
+
+
+def calc_current_fpr(k, m, n):
+    """
+    Calculate the probability of a false positive when inserting element number n into a bloom filter composed of k
+    hashes and m bits.
+    :param k: Number of hashes
+    :param n: Nth element
+    :param m: Number of bits
+    :return: False positive rate
+    """
+    return (1-e**(-k*n/m))**k
+
+
+def generate_slides(bin_x, bin_y):
+    """
+    Generate all windows across the concatenation of two bitstrings.
+    :param bin_x: First bitstring.
+    :param bin_y: Second bitstring.
+    :return: A list of all windows across the given bitstrings.
+    """
+    slides = []
+    combined = bin_x + bin_y
+    for i in range(len(bin_x)):
+        slides.append(combined[i:i+len(bin_x)])
+    print(slides)
+    return slides
+
+
+def slide_blocks(blocks, blocksize):
+    """
+    Convert list of non-overlapping blocks into overlapping blocks.
+    :param blocks: List of non-sliding blocks built from input data.
+    :param blocksize: User-specified blocksize.
+    :return: A list of overlapping blocks based on user-specified input data.
+    """
+    completed_blocks = []
+    aux = iter(blocks)
+    for x, y in zip(aux, aux):
+        print(x, y)
+        bin_x = "{0:0{blocksize}b}".format(x, blocksize=blocksize)
+        bin_y = "{0:0{blocksize}b}".format(y, blocksize=blocksize)
+        completed_blocks.extend(generate_slides(bin_x, bin_y))
+        print()
+    return completed_blocks
+
+
+def get_blocks(input_data, blocksize):
+    """
+    Split input data into blocks.
+    :param input_data: User-specified input data.
+    :param blocksize: User-specified blocksize.
+    :return:
+    """
+    blocks = []
+    with open(input_data, "rb") as f:
+        while True:
+            block = f.read(int(blocksize/8))
+            if not block:
+                break
+            blocks.append(int.from_bytes(block, "big"))
+    return blocks
+
+
+def get_num_blocks(input_file, blocksize):
+    """
+    Determine the number of blocks in input data based on specified blocksize.
+    :param input_file: User-specified input data.
+    :param blocksize: User-specified blocksize.
+    :return:
+    """
+    size = os.path.getsize(input_file)
+    blocksize_bytes = blocksize / 8
+    return size / blocksize_bytes
+
+
+def tracker_dict():
+    """
+    Returns dictionary to be used as default dictionary.
+    :return: Template for output dictionary.
+    """
+    return {
+        "num_reps": 0,
+        "bin_rep": "",
+        "indices": []
+    }
+
+
+def stream_blocks(read, num_blocks, blocksize, chunk_blocks=STREAM_BLOCKS):
+    """
+    Lazily split a byte stream into blocks, without holding the whole stream in memory.
+    :param read: Callable taking a number of bytes and returning that many bytes (e.g. os.urandom)
+    :param num_blocks: Number of blocks to produce
+    :param blocksize: User-specified blocksize.
+    :param chunk_blocks: Number of blocks to request from the stream at a time
+    :return: Generator of integer blocks
+    """
+    width = int(blocksize / 8)
+    remaining = num_blocks
+    if blocksize <= 64:                                     # Blocks fit a machine word, so let numpy split each chunk
+        import numpy as np                                  # Deferred so that importing core never imports numpy
+        dtype = np.dtype(">u%d" % width)
+    while remaining > 0:
+        count = min(chunk_blocks, remaining)
+        chunk = read(count * width)
+        if blocksize <= 64:
+            yield from np.frombuffer(chunk, dtype=dtype).tolist()
+        else:
+            for j in range(0, count * width, width):
+                yield int.from_bytes(chunk[j:j+width], "big")
+        remaining -= count
+
+
+def bytes_to_blocks(num_bytes, blocksize, sliding=False):
+    """
+    Convert a size in bytes into a number of whole blocks, as counted by track_hits.
+    With a sliding window, every pair of blocks is turned into blocksize windows (see slide_blocks), so the size is
+    rounded to whole pairs.
+    :param num_bytes: Size in bytes.
+    :param blocksize: User-specified blocksize.
+    :param sliding: No sliding window (0) or sliding window (1)
+    :return: Number of whole blocks (at least 1 block, or 1 pair of windows) covering num_bytes.
+    """
+    if sliding:
+        return max(1, num_bytes // int(blocksize / 4)) * blocksize
+    return max(1, num_bytes // int(blocksize / 8))
+
+
+def segment_tracker(end, new_reps, cum_hits, cum_fps):
+    """
+    Returns dictionary recording the repetition statistics of a single segment.
+    :param end: Index of the block following the last block of the segment
+    :param new_reps: Number of repetitions observed within the segment
+    :param cum_hits: Number of repetitions observed from the start of the input up to the end of the segment
+    :param cum_fps: Number of false positives expected from the start of the input up to the end of the segment
+    :return: Segment dictionary.
+    """
+    return {
+        "end": end,
+        "new_reps": new_reps,
+        "cum_hits": cum_hits,
+        "cum_fps": cum_fps
+    }
+
+
+def track_hits(blocks, num_blocks, err_rate, blocksize, progress=None, segment_size=0, engine="bloom",
+               track_fpr=True):
+    """
+    Pass blocks through a set-membership engine, recording every repetition observed along the way
+    :param blocks: Iterable of integer blocks
+    :param num_blocks: Number of blocks in the iterable (used to size the engine)
+    :param err_rate: Desired error rate for the underlying engine
+    :param blocksize: Blocksize of the given blocks
+    :param progress: Optional callable receiving the index of each block once it has been processed
+    :param segment_size: Number of blocks per segment for the segment profile, or 0 to disable segmenting
+    :param engine: Name of the engine in ENGINES
+    :param track_fpr: Whether to track the FPR across insertion time (always tracked when segmenting)
+    :return: A tuple of (hits, average FPR across insertion time or None if untracked, list of segment dictionaries)
+    """
+    bf = load_backend(ENGINES, engine)(num_blocks, err_rate)    # Instantiate the chosen engine
+    add = bf.add
+    track_fpr = track_fpr or bool(segment_size)
+    hits = defaultdict(tracker_dict)
+    fpr_total = 0
+    segments = []
+    cum_hits = 0
+    seg_start_hits = 0
+
+    for i, block in enumerate(blocks):                      # For each block
+        if block in bf:                                     # If the block is in the engine
+            hits[block]["num_reps"] += 1                    # Increase the number of observed repetitions for this block
+            hits[block]["indices"].append(i)                # Associate current block index with nth repetition
+            hits[block]["bin_rep"] = "{0:0{blocksize}b}".format(block, blocksize=blocksize)
+            cum_hits += 1
+        else:                                               # If the block was not in the engine
+            add(block)                                      # Add it to the engine, but not as a repetition
+
+        # Record FPR for current insertion
+        if track_fpr:
+            fpr_total += bf.current_fpr(i+1)
+
+        # Close off the current segment once it is full, or at the final block
+        if segment_size and ((i+1) % segment_size == 0 or i+1 == num_blocks):
+            segments.append(segment_tracker(i+1, cum_hits - seg_start_hits, cum_hits, fpr_total))
+            seg_start_hits = cum_hits
+
+        if progress is not None:
+            progress(i)
+
+    # Determine average FPR across insertion time
+    return hits, fpr_total / num_blocks if track_fpr else None, segments
+
+
+def bitreps_measure(input_file, blocksize, progress_bar, sliding, err_rate, segment_size=0, engine="bloom"):
+    """
+    Orchestrate the BitReps test for a given input
+    :param input_file: Path of input data
+    :param blocksize: Desired blocksize for BitReps test
+    :param progress_bar: Representation of progress bar with a setValue method (passed from frontend), or None
+    :param sliding: No sliding window (0) or sliding window (1)
+    :param err_rate: Desired error rate for the underlying engine
+    :param segment_size: Number of blocks per segment for the segment profile, or 0 to disable segmenting
+    :param engine: Name of the engine in ENGINES
+    :return: None
+    """
+    # Ensure chosen blocksize is valid
+    try:
+        assert blocksize in POSSIBLE_BLKS
+    except AssertionError:
+        print("Invalid blocksize! Must be 16, 32, 64, 128, 256 or 512.")
+        exit(1)
+
+    # Ensure chosen error rate is valid
+    try:
+        assert 0 <= err_rate <= 1
+    except AssertionError:
+        print("Invalid error rate! Must be a float between 0 and 1 inclusive.")
+        exit(1)
+
+    blocks = get_blocks(input_file, blocksize)              # Split input data into blocks
+
+    if sliding:                                             # If the user specifies a sliding window
+        blocks = slide_blocks(blocks, blocksize)            # Convert blocks into sliding blocks
+        blocks = [int(window, 2) for window in blocks]      # Windows are bitstrings, blocks are integers
+
+    num_blocks = len(blocks)                                # Number of blocks in the input data
+    percent = num_blocks / 100                              # Determine percentage increment requirement for GUI
+
+    def progress(i):
+        # Increment the progress bar (for the GUI)
+        if i % max(1, floor(percent)) == 0:
+            progress_bar.setValue(i / percent)
+
+    hits, afpr, segments = track_hits(blocks, num_blocks, err_rate, blocksize,
+                                      progress if progress_bar is not None else None, segment_size, engine)
+
+    outer_hits = {
+        "hits": hits,
+        "blocksize": blocksize,
+        "sliding": sliding,
+        "err_rate": err_rate,
+        "engine": engine,
+        "num_blocks": num_blocks,
+        "avg_err_rate": afpr,
+        "segment_size": segment_size,
+        "segments": segments
+    }
+
+    # Obtain input file name in preparation for output file
+    output_name = os.path.splitext(os.path.basename(input_file))[0]
+
+    # Write the output JSON, named by engine as well so that measurements with different engines do not overwrite
+    output_path = os.path.join(OUTPUT_DIR, "%s-%s-%s-%s-%s.json" % (
+        output_name, engine, blocksize, str(err_rate).replace(".", "_"), sliding))
+    with open(output_path, "w+") as of:
+        json.dump(outer_hits, of, indent=2)
+
+    # Complete the progress bar
+    if progress_bar is not None:
+        progress_bar.setValue(100)
@@ -0,0 +1,368 @@
+from core import INDEX_DIR, POSSIBLE_BLKS
+import numpy as np
+import warnings
+import json
+import os
+
+
+CHUNK_BLOCKS = 2 ** 24                                  # Blocks read, sorted and stored per new index run
+MERGE_BLOCKS = 2 ** 22                                  # Blocks taken from a run at a time while merging runs
+FANOUT = 4                                              # Runs on one level before they are merged into the next
+OFFSET_BITS = 40                                        # Low bits of a location hold the block offset, high the file
+MAX_CHANCE = 1                                          # Expected chance collisions above which a query is refused
+MAX_COLLISIONS = 10 ** 7                                # Colliding block pairs collected per query before truncating
+
+
+def check_blocksize(blocksize):
+    """
+    Ensure a blocksize is supported
+    :param blocksize: Blocksize of the index
+    :return: None
+    """
+    if blocksize not in POSSIBLE_BLKS:
+        raise ValueError("Invalid blocksize! Must be one of %s." % POSSIBLE_BLKS)
+
+
+def get_dtype(blocksize):
+    """
+    Determine how blocks are stored in the index. Blocks of up to 64 bits are stored as big-endian integers, which sort
+    far faster than raw bytes; larger blocks are stored as raw bytes. Either way they order by their integer value.
+    :param blocksize: Blocksize of the index
+    :return: numpy dtype of the blocks
+    """
+    width = int(blocksize / 8)
+    return np.dtype(">u%d" % width if blocksize <= 64 else "V%d" % width)
+
+
+def get_index_dir(blocksize):
+    """
+    Determine the directory holding the block index for a given blocksize
+    :param blocksize: Blocksize of the index
+    :return: Path of the index directory
+    """
+    return os.path.join(INDEX_DIR, str(blocksize))
+
+
+def load_manifest(blocksize):
+    """
+    Read the manifest listing the files and sorted runs making up the index for a given blocksize
+    :param blocksize: Blocksize of the index
+    :return: Manifest dictionary (empty if the index does not exist yet)
+    """
+    manifest_path = os.path.join(get_index_dir(blocksize), "manifest.json")
+    if not os.path.isfile(manifest_path):
+        return {"blocksize": blocksize, "files": [], "runs": [], "next_run": 0}
+    with open(manifest_path) as f:
+        return json.load(f)
+
+
+def save_manifest(manifest):
+    """
+    Write the manifest of an index, creating the index directory if necessary
+    :param manifest: Manifest dictionary
+    :return: None
+    """
+    index_dir = get_index_dir(manifest["blocksize"])
+    os.makedirs(index_dir, exist_ok=True)
+    with open(os.path.join(index_dir, "manifest.json"), "w+") as f:
+        json.dump(manifest, f, indent=2)
+
+
+def get_run_paths(manifest, run):
+    """
+    Determine where the blocks and locations of a run are stored
+    :param manifest: Manifest dictionary
+    :param run: Run dictionary from the manifest
+    :return: (Path of the sorted blocks, path of their locations)
+    """
+    index_dir = get_index_dir(manifest["blocksize"])
+    return (os.path.join(index_dir, "%s.keys.npy" % run["name"]),
+            os.path.join(index_dir, "%s.locs.npy" % run["name"]))
+
+
+def new_run(manifest, level, num_blocks):
+    """
+    Allocate a new run in the manifest
+    :param manifest: Manifest dictionary
+    :param level: Level of the run, 0 for runs read straight from a file
+    :param num_blocks: Number of blocks in the run
+    :return: Run dictionary
+    """
+    run = {"name": "run-%06d" % manifest["next_run"], "level": level, "num_blocks": num_blocks}
+    manifest["next_run"] += 1
+    manifest["runs"].append(run)
+    return run
+
+
+def load_runs(manifest):
+    """
+    Memory-map every run of an index
+    :param manifest: Manifest dictionary
+    :return: List of (run blocks, run locations)
+    """
+    runs = []
+    for run in manifest["runs"]:
+        keys_path, locs_path = get_run_paths(manifest, run)
+        runs.append((np.load(keys_path, mmap_mode="r"), np.load(locs_path, mmap_mode="r")))
+    return runs
+
+
+def merge_runs(manifest, runs, level):
+    """
+    Merge sorted runs into a single sorted run on the given level, a bounded batch at a time so that runs larger than
+    memory can be merged. Each batch takes every block up to the smallest of the runs' batch-end blocks, which no block
+    left behind in any run can precede.
+    :param manifest: Manifest dictionary
+    :param runs: Run dictionaries to merge
+    :param level: Level of the merged run
+    :return: Run dictionary of the merged run
+    """
+    sources = []
+    for run in runs:
+        keys_path, locs_path = get_run_paths(manifest, run)
+        sources.append((np.load(keys_path, mmap_mode="r"), np.load(locs_path, mmap_mode="r")))
+
+    total = sum(len(keys) for keys, _ in sources)
+    merged = new_run(manifest, level, total)
+    keys_path, locs_path = get_run_paths(manifest, merged)
+    out_keys = np.lib.format.open_memmap(keys_path, mode="w+", dtype=sources[0][0].dtype, shape=(total,))
+    out_locs = np.lib.format.open_memmap(locs_path, mode="w+", dtype=np.uint64, shape=(total,))
+
+    cursors = [0] * len(sources)
+    written = 0
+    while written < total:
+        ends = [keys[min(c + MERGE_BLOCKS, len(keys)) - 1:min(c + MERGE_BLOCKS, len(keys))]
+                for (keys, _), c in zip(sources, cursors) if c < len(keys)]
+        pivot = min(ends, key=lambda end: end.tobytes() if end.dtype.kind == "V" else int(end[0]))
+
+        batch_keys, batch_locs = [], []
+        for i, (keys, locs) in enumerate(sources):
+            stop = int(np.searchsorted(keys, pivot, side="right")[0])
+            if stop > cursors[i]:
+                batch_keys.append(keys[cursors[i]:stop])
+                batch_locs.append(locs[cursors[i]:stop])
+                cursors[i] = stop
+
+        batch_keys = np.concatenate(batch_keys)
+        order = np.argsort(batch_keys, kind="stable")
+        out_keys[written:written + len(order)] = batch_keys[order]
+        out_locs[written:written + len(order)] = np.concatenate(batch_locs)[order]
+        written += len(order)
+
+    out_keys.flush()
+    out_locs.flush()
+    return merged
+
+
+def compact(manifest):
+    """
+    Merge runs LSM-style: whenever FANOUT runs share a level, they are merged into one run on the level above. An index
+    of N blocks is left with fewer than FANOUT runs on each of about log_FANOUT(N / CHUNK_BLOCKS) levels, so queries
+    stay at a handful of lookups however many files are added. Saves the manifest before removing merged runs.
+    :param manifest: Manifest dictionary
+    :return: None
+    """
+    obsolete = []
+    level = 0
+    while any(run["level"] >= level for run in manifest["runs"]):
+        on_level = [run for run in manifest["runs"] if run["level"] == level]
+        if len(on_level) >= FANOUT:
+            manifest["runs"] = [run for run in manifest["runs"] if run["level"] != level]
+            merge_runs(manifest, on_level, level + 1)
+            obsolete.extend(on_level)
+        level += 1
+
+    save_manifest(manifest)
+    for run in obsolete:
+        for path in get_run_paths(manifest, run):
+            os.remove(path)
+
+
+def check_chance(query_blocks, manifest, force):
+    """
+    Refuse queries where blocks are expected to collide by chance, e.g. small blocksizes against a large index, as the
+    genuine collisions would be buried and the number of reported pairs would grow with the product of both sizes
+    :param query_blocks: Number of blocks in the queried file
+    :param manifest: Manifest dictionary
+    :param force: Query regardless
+    :return: None
+    """
+    corpus_blocks = sum(entry["num_blocks"] for entry in manifest["files"])
+    expected = query_blocks * corpus_blocks / 2 ** manifest["blocksize"]
+    if expected > MAX_CHANCE and not force:
+        raise ValueError("About %d chance collisions expected for %s-bit blocks against this index! Use a larger "
+                         "blocksize, or force the query." % (expected, manifest["blocksize"]))
+
+
+def read_chunks(input_file, blocksize, chunk_blocks=CHUNK_BLOCKS):
+    """
+    Read input data as blocks, a chunk at a time. A trailing partial block is ignored.
+    :param input_file: Path of input data
+    :param blocksize: User-specified blocksize.
+    :param chunk_blocks: Number of blocks per chunk
+    :return: Generator of (offset of first block in chunk, array of blocks)
+    """
+    dtype = get_dtype(blocksize)
+    offset = 0
+    with open(input_file, "rb") as f:
+        while True:
+            keys = np.fromfile(f, dtype=dtype, count=chunk_blocks)
+            if not len(keys):
+                break
+            yield offset, keys
+            offset += len(keys)
+
+
+def query_run(keys, run_keys, run_locs, limit):
+    """
+    Find every occurrence of the given blocks within a sorted index run
+    :param keys: Sorted array of blocks to look up
+    :param run_keys: Sorted (memory-mapped) blocks of the run
+    :param run_locs: Locations corresponding to run_keys
+    :param limit: Maximum number of colliding pairs to return
+    :return: (Positions in keys which collided, locations of the matching blocks, whether pairs were left out)
+    """
+    lo = np.searchsorted(run_keys, keys, side="left")
+    hi = np.searchsorted(run_keys, keys, side="right")
+    counts = hi - lo
+    hit = np.nonzero(counts)[0]
+    reps = counts[hit]
+
+    # Stop before expanding more pairs than the limit allows
+    truncated = bool(len(reps)) and int(reps.sum()) > limit
+    if truncated:
+        keep = int(np.searchsorted(np.cumsum(reps), limit, side="right"))
+        hit, reps = hit[:keep], reps[:keep]
+
+    # Expand each [lo, hi) range so every matching block in the run is reported, not just the first
+    positions = np.repeat(hit, reps)
+    within = np.arange(len(positions)) - np.repeat(np.cumsum(reps) - reps, reps)
+    return positions, np.asarray(run_locs[np.repeat(lo[hit], reps) + within]), truncated
+
+
+def scan_file(input_path, manifest, file_id=None, chunk_blocks=CHUNK_BLOCKS, limit=MAX_COLLISIONS):
+    """
+    Read a file once, looking up each chunk against the runs already in the index and, if a file id is given, storing
+    each chunk as a new level 0 run
+    :param input_path: Path of input data
+    :param manifest: Manifest dictionary
+    :param file_id: Id under which to store the file, or None to only query
+    :param chunk_blocks: Number of blocks of the input held in memory at a time
+    :param limit: Maximum number of colliding pairs to collect
+    :return: (Array of (earlier file id, offset, earlier offset), whether pairs were left out, number of blocks read)
+    """
+    runs = load_runs(manifest)                          # Existing runs only, so a file never collides with itself
+    mask = np.uint64(2 ** OFFSET_BITS - 1)
+    found = [np.empty((0, 3), dtype=np.uint64)]
+    truncated = False
+    num_blocks = 0
+
+    for offset, keys in read_chunks(input_path, manifest["blocksize"], chunk_blocks):
+        order = np.argsort(keys, kind="stable")
+        sorted_keys = keys[order]
+        offsets = order.astype(np.uint64) + np.uint64(offset)
+
+        for run_keys, run_locs in runs:
+            if limit <= 0:
+                truncated = True
+                break
+            positions, locs, cut = query_run(sorted_keys, run_keys, run_locs, limit)
+            found.append(np.column_stack((locs >> np.uint64(OFFSET_BITS), offsets[positions], locs & mask)))
+            limit -= len(positions)
+            truncated = truncated or cut
+
+        if file_id is not None:
+            run = new_run(manifest, 0, len(keys))
+            keys_path, locs_path = get_run_paths(manifest, run)
+            np.save(keys_path, sorted_keys)
+            np.save(locs_path, (np.uint64(file_id) << np.uint64(OFFSET_BITS)) | offsets)
+        num_blocks += len(keys)
+
+    return np.concatenate(found), truncated, num_blocks
+
+
+def collapse_collisions(pairs, files):
+    """
+    Merge colliding pairs at consecutive offsets in both files into shared segments, which is how a reused stream shows
+    :param pairs: Array of (earlier file id, offset, earlier offset)
+    :param files: Mapping of file id to file path
+    :return: Mapping of earlier file path to an (n, 3) array of (offset, earlier offset, length), ordered by offset
+    """
+    pairs = pairs.astype(np.int64)
+    shift = pairs[:, 2] - pairs[:, 1]
+    order = np.lexsort((pairs[:, 1], shift, pairs[:, 0]))
+    pairs, shift = pairs[order], shift[order]
+
+    # A new segment starts wherever the earlier file, the shift between both offsets or the run of offsets changes
+    starts = np.ones(len(pairs), dtype=bool)
+    starts[1:] = (pairs[1:, 0] != pairs[:-1, 0]) | (shift[1:] != shift[:-1]) | (pairs[1:, 1] != pairs[:-1, 1] + 1)
+    first = np.nonzero(starts)[0]
+    segments = np.column_stack((pairs[first, 1], pairs[first, 2], np.diff(np.append(first, len(pairs)))))
+
+    collisions = {}
+    for file_id in np.unique(pairs[first, 0]):
+        mine = segments[pairs[first, 0] == file_id]
+        collisions[files[int(file_id)]] = mine[np.argsort(mine[:, 0], kind="stable")]
+    return collisions
+
+
+def report_collisions(pairs, truncated, manifest, limit):
+    """
+    Turn the pairs found by scan_file into the result of a query, warning if they were truncated
+    :param pairs: Array of (earlier file id, offset, earlier offset)
+    :param truncated: Whether pairs were left out
+    :param manifest: Manifest dictionary
+    :param limit: Maximum number of colliding pairs which were collected
+    :return: Mapping of earlier file path to an (n, 3) array of (offset, earlier offset, length), all in blocks
+    """
+    if truncated:
+        warnings.warn("Collisions truncated to the first %d colliding blocks." % limit)
+    return collapse_collisions(pairs, {entry["id"]: entry["path"] for entry in manifest["files"]})
+
+
+def query_file(input_file, blocksize, chunk_blocks=CHUNK_BLOCKS, force=False, limit=MAX_COLLISIONS):
+    """
+    Find every block of a file which also occurs in a file already in the index, without adding it to the index
+    :param input_file: Path of input data
+    :param blocksize: Blocksize of the index to query
+    :param chunk_blocks: Number of blocks of the input held in memory at a time
+    :param force: Query even if chance collisions are expected at this blocksize
+    :param limit: Maximum number of colliding blocks to collect
+    :return: Mapping of earlier file path to an (n, 3) array of (offset, earlier offset, length), all in blocks
+    """
+    check_blocksize(blocksize)
+    manifest = load_manifest(blocksize)
+    check_chance(os.path.getsize(input_file) // int(blocksize / 8), manifest, force)
+
+    pairs, truncated, _ = scan_file(input_file, manifest, chunk_blocks=chunk_blocks, limit=limit)
+    return report_collisions(pairs, truncated, manifest, limit)
+
+
+def add_file(input_file, blocksize, chunk_blocks=CHUNK_BLOCKS, force=False, limit=MAX_COLLISIONS):
+    """
+    Add a file to the index for the given blocksize, reporting its collisions with the files already indexed. The file
+    is read once: each chunk is queried against the existing runs and then stored as a new sorted run, after which the
+    runs are compacted.
+    :param input_file: Path of input data
+    :param blocksize: Blocksize of the index
+    :param chunk_blocks: Number of blocks of the input held in memory (and stored per new run) at a time
+    :param force: Add even if chance collisions are expected at this blocksize
+    :param limit: Maximum number of colliding blocks to collect
+    :return: Mapping of earlier file path to an (n, 3) array of (offset, earlier offset, length), all in blocks
+    """
+    check_blocksize(blocksize)
+    input_path = os.path.abspath(input_file)
+    manifest = load_manifest(blocksize)
+    if any(entry["path"] == input_path for entry in manifest["files"]):
+        raise ValueError("%s is already in the %s-bit index." % (input_path, blocksize))
+    check_chance(os.path.getsize(input_path) // int(blocksize / 8), manifest, force)
+
+    file_id = len(manifest["files"])
+    os.makedirs(get_index_dir(blocksize), exist_ok=True)
+    pairs, truncated, num_blocks = scan_file(input_path, manifest, file_id, chunk_blocks, limit)
+
+    # Only record the file once all of its runs are on disk
+    manifest["files"].append({"id": file_id, "path": input_path, "num_blocks": num_blocks})
+    compact(manifest)
+
+    return report_collisions(pairs, truncated, manifest, limit)
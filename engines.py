@@ -0,0 +1,115 @@
+from core import calc_current_fpr
+from math import ceil, expm1, log, log1p, log2
+from hashlib import blake2b
+
+
+class BloomEngine:
+    """
+    Bloom filter engine (bloom_filter2), trading a small false positive rate for memory proportional to the number of
+    blocks rather than their size
+    """
+    def __init__(self, max_elements, error_rate):
+        from bloom_filter2 import BloomFilter           # Optional dependency, only imported once this engine is chosen
+        self.bf = BloomFilter(max_elements=max_elements, error_rate=error_rate)
+
+    @staticmethod
+    def get_size(max_elements, error_rate):
+        """
+        Determine the number of hashes and bits bloom_filter2 gives a filter, without allocating it
+        :param max_elements: Number of elements the filter is sized for
+        :param error_rate: Target false positive rate of the filter
+        :return: (Number of hashes, number of bits)
+        """
+        num_bits_m = int(ceil(-max_elements * log(error_rate) / log(2) ** 2))
+        return int(ceil(num_bits_m / max_elements * log(2))), num_bits_m
+
+    @staticmethod
+    def mean_fpr(max_elements, error_rate, points=1000):
+        """
+        Average probability of a false positive across inserting max_elements elements, as averaged by track_hits,
+        without allocating the filter
+        :param max_elements: Number of elements inserted (and the filter is sized for)
+        :param error_rate: Target false positive rate of the filter
+        :param points: Number of insertions sampled (midpoint rule)
+        :return: Average false positive rate
+        """
+        k, m = BloomEngine.get_size(max_elements, error_rate)
+        return sum(calc_current_fpr(k, m, max_elements * (j + 0.5) / points) for j in range(points)) / points
+
+    def __contains__(self, block):
+        return block in self.bf
+
+    def add(self, block):
+        self.bf.add(block)
+
+    def current_fpr(self, n):
+        """
+        Probability of a false positive when inserting the nth element
+        :param n: Nth element
+        :return: False positive rate
+        """
+        return calc_current_fpr(self.bf.num_probes_k, self.bf.num_bits_m, n)
+
+
+class ExactEngine(set):
+    """
+    Exact engine backed by a set, with no false positives at the cost of storing every distinct block. Subclassing set
+    keeps membership tests and insertions at C speed in the measurement loop.
+    """
+    def __init__(self, max_elements, error_rate):
+        super().__init__()
+
+    def current_fpr(self, n):
+        return 0
+
+    @staticmethod
+    def mean_fpr(max_elements, error_rate):
+        return 0
+
+
+class SketchEngine:
+    """
+    Fingerprint sketch engine, storing a short hash of each block rather than the block itself, so memory no longer
+    grows with the blocksize. Fingerprints are sized so that the false positive rate after max_elements insertions is
+    about error_rate.
+    """
+    def __init__(self, max_elements, error_rate):
+        bits = 64 if error_rate <= 0 else ceil(log2(max(max_elements, 1) / error_rate))
+        self.bits = min(max(bits, 1), 64)
+        self.seen = set()
+
+    def fingerprint(self, block):
+        """
+        BLAKE2b hash of the block's bytes, keeping the top bits. Python's hash() is not used, as it reduces integers
+        modulo 2 ** 61 - 1 and so gives blocks differing by a multiple of that the same fingerprint whatever the size.
+        :param block: Integer block
+        :return: Fingerprint of self.bits bits
+        """
+        digest = blake2b(block.to_bytes((block.bit_length() + 7) // 8, "big"), digest_size=8).digest()
+        return int.from_bytes(digest, "big") >> (64 - self.bits)
+
+    def __contains__(self, block):
+        return self.fingerprint(block) in self.seen
+
+    def add(self, block):
+        self.seen.add(self.fingerprint(block))
+
+    def current_fpr(self, n):
+        """
+        Probability that the nth element's fingerprint matches one of the n - 1 before it
+        :param n: Nth element
+        :return: False positive rate
+        """
+        return -expm1((n - 1) * log1p(-2.0 ** -self.bits))
+
+    @staticmethod
+    def mean_fpr(max_elements, error_rate):
+        """
+        Average probability of a false positive across inserting max_elements elements, without building the sketch
+        :param max_elements: Number of elements inserted (and the sketch is sized for)
+        :param error_rate: Target false positive rate of the sketch
+        :return: Average false positive rate
+        """
+        bits = SketchEngine(max_elements, error_rate).bits
+        q = 2.0 ** -bits
+        return 1 + expm1(max_elements * log1p(-q)) / (max_elements * q)
@@ -1,33 +1,66 @@
 from PyQt5.QtWidgets import QApplication, QWidget, QVBoxLayout, QHBoxLayout, QLabel, QPushButton, QLineEdit, \
     QFileDialog, QProgressBar, QCheckBox, QTabWidget, QTextEdit
-from processor import get_meta_data, get_exp_fps, get_highest_rep, get_exp_dupes, get_ratio, calc_chi
-from main import bitreps_measure, dir_setup, RESULTS_DIR
+from PyQt5.QtCore import QThread, pyqtSignal
+from processor import get_engine, get_meta_data, load_data, summarise
+from core import bitreps_measure, bytes_to_blocks, dir_setup, RESULTS_DIR
+from model import DEFAULT_RUNS, generate_model
 from pathlib import Path
 import sys
 import os
 
 
-def set_t2_stats_edit(exp="", obs="", chi="", efp="", ed="", oh="", ra="", mr=""):
+def set_t2_stats_edit(exp="", obs="", chi="", pv="", efp="", ed="", oh="", ra="", mr="", ws=""):
     """
     Template string for automated statistical analysis display
     :param exp: Expected distribution
     :param obs: Observed distribution
     :param chi: Chi-square result
+    :param pv: Empirical p-value of the chi-square result (requires a generated model)
     :param efp: Expected number of false positives
     :param ed: Expected number of genuine duplicates
     :param oh: Observed number of repetitions
     :param ra: Num. expected hits / Num. observed hits
     :param mr: Maximally repeating block within RNG output
+    :param ws: Segment with the greatest excess of repetitions (segmented measurements only)
     :return: Formatted string of given parameters
     """
     return "Expected distribution: %s\n" \
            "Observed distribution: %s\n" \
-           "Chi-square: %s\n\n" \
+           "Chi-square: %s\n" \
+           "p-value: %s\n\n" \
            "Expected false positives: %s\n" \
            "Expected duplicates: %s\n" \
            "Observed hits: %s\n" \
            "Ratio: %s\n\n" \
-           "Maximum repetition: %s\n" % (exp, obs, chi, efp, ed, oh, ra, mr)
+           "Maximum repetition: %s\n" \
+           "Worst segment: %s\n" % (exp, obs, chi, pv, efp, ed, oh, ra, mr, ws)
+
+
+class ModelWorker(QThread):
+    """
+    Generates a model away from the GUI thread, reporting progress as a percentage of completed baseline runs
+    """
+    progress = pyqtSignal(int)
+    done = pyqtSignal(str)
+    failed = pyqtSignal(str)
+
+    def __init__(self, blocksize, err_rate, num_blocks, engine, runs=DEFAULT_RUNS):
+        super().__init__()
+        self.blocksize = blocksize
+        self.err_rate = err_rate
+        self.num_blocks = num_blocks
+        self.engine = engine
+        self.runs = runs
+
+    def run(self):
+        try:
+            model_path = generate_model(self.blocksize, self.err_rate, self.num_blocks, self.runs,
+                                        progress=lambda n: self.progress.emit(int(100 * n / self.runs)),
+                                        engine=self.engine)
+        except Exception as err:                    # Any failure must reach the GUI, which re-enables Generate
+            self.failed.emit("Model generation failed: %s" % (str(err) or type(err).__name__))
+            return
+        self.done.emit(model_path)
 
 
 class BitReps(QWidget):
@@ -91,6 +124,14 @@ class BitReps(QWidget):
         self.t1_sub_4.addWidget(self.t1_err_lab)
         self.t1_sub_4.addWidget(self.t1_err_edit)
 
+        # Segment size label and input
+        self.t1_sub_6 = QHBoxLayout()
+        self.t1_seg_lab = QLabel("Segment size:")
+        self.t1_seg_edit = QLineEdit()
+        self.t1_seg_edit.setPlaceholderText("In bytes... (leave blank for no segment profile)")
+        self.t1_sub_6.addWidget(self.t1_seg_lab)
+        self.t1_sub_6.addWidget(self.t1_seg_edit)
+
         # Reset and run buttons
         self.t1_sub_5 = QHBoxLayout()
         self.t1_rst_btn = QPushButton("Reset")
@@ -110,6 +151,7 @@ class BitReps(QWidget):
         self.tab1_layout.addLayout(self.t1_sub_2)
         self.tab1_layout.addLayout(self.t1_sub_3)
         self.tab1_layout.addLayout(self.t1_sub_4)
+        self.tab1_layout.addLayout(self.t1_sub_6)
         self.tab1_layout.addLayout(self.t1_sub_5)
         self.tab1_layout.addWidget(self.t1_prog)
 
@@ -175,19 +217,23 @@ class BitReps(QWidget):
         self.t2_rst_btn.clicked.connect(self.t2_reset)
         self.t2_run_btn.clicked.connect(self.analyse)
         self.t2_wrt_btn.clicked.connect(self.write_results)
-
-        self.t2_gen_btn.setEnabled(False)
+        self.t2_gen_btn.clicked.connect(self.generate)
 
         self.t2_sub_4.addWidget(self.t2_rst_btn)
         self.t2_sub_4.addWidget(self.t2_run_btn)
         self.t2_sub_4.addWidget(self.t2_wrt_btn)
         self.t2_sub_4.addWidget(self.t2_gen_btn)
 
+        # Model generation progress bar
+        self.t2_prog = QProgressBar()
+        self.t2_prog.setValue(0)
+
         # Add everything to tab 2
         self.tab2_layout.addLayout(self.t2_sub_1)
         self.tab2_layout.addLayout(self.t2_sub_2)
         self.tab2_layout.addLayout(self.t2_sub_3)
         self.tab2_layout.addLayout(self.t2_sub_4)
+        self.tab2_layout.addWidget(self.t2_prog)
 
         # ##### Add tabs to main layout ##### #
         self.tabwidget.addTab(self.tab1, "Calculator")
@@ -200,6 +246,9 @@ class BitReps(QWidget):
         self.t2_file = ""
         self.t2_model = ""
 
+        # Background model generation
+        self.worker = None
+
         # Chi-square distributions
         self.exp = []
         self.obs = []
@@ -234,6 +283,9 @@ class BitReps(QWidget):
     def get_t1_size(self):
         return self.t1_size_edit.text()
 
+    def get_t1_seg(self):
+        return self.t1_seg_edit.text()
+
     def set_t1_file(self, name):
         self.t1_file = name
         self.t1_input_edit.setText(name)
@@ -275,6 +327,7 @@ class BitReps(QWidget):
         self.set_t1_file("")
         self.t1_size_edit.setText("")
         self.t1_err_edit.setText("")
+        self.t1_seg_edit.setText("")
 
     def t2_reset(self):
         """
@@ -293,39 +346,73 @@ class BitReps(QWidget):
         Perform statistical analysis over the chosen BitReps measurements file
         :return: None
         """
-        # Obtain metadata
-        meta_data = get_meta_data(self.get_t2_file())
-        bs, sw, er, nb, oh, avger = meta_data[0], meta_data[1], meta_data[2], meta_data[3], meta_data[4], meta_data[5]
+        try:
+            summary = summarise(self.get_t2_file(), self.get_t2_model())
+        except ValueError as err:                   # e.g. a model generated for different parameters
+            self.t2_stats_edit.setText(str(err))
+            return
 
         # Set metadata labels
-        self.set_t2_size(bs)
-        self.set_t2_slide(sw)
-        self.set_t2_err(er)
-
-        # Obtain expected false positives, duplicates, highest rep, ratio
-        exp_fps = get_exp_fps(nb, avger)
-        exp_dupes = get_exp_dupes(nb, bs)
-        highest_rep = get_highest_rep(self.get_t2_file())
-        ratio = get_ratio(oh, (exp_fps + exp_dupes))
-
-        # Obtain and unpack chi-square-related information
-        chi = calc_chi(self.get_t2_file(), self.get_t2_model())
-        chi_val = chi[0]
-        self.set_obs(chi[1])
-        self.set_exp(chi[2])
+        self.set_t2_size(summary["blocksize"])
+        self.set_t2_slide(summary["sliding"])
+        self.set_t2_err(summary["err_rate"])
+
+        self.set_obs(summary["obs"])
+        self.set_exp(summary["exp"])
+        p_value = "N/A (select a generated model)" if summary["p_value"] is None else round(summary["p_value"], 4)
 
         # Write analysis output to display
         self.t2_stats_edit.setText(set_t2_stats_edit(
             str(self.get_exp()),
             str(self.get_obs()),
-            round(chi_val, 2),
-            exp_fps,
-            exp_dupes,
-            oh,
-            ratio,
-            highest_rep
+            round(summary["chi"], 2),
+            p_value,
+            summary["exp_fps"],
+            summary["exp_dupes"],
+            summary["obs_hits"],
+            summary["ratio"],
+            summary["highest_rep"],
+            summary["worst_segment"]
         ))
 
+    def generate(self):
+        """
+        Generate a model matching the blocksize, error rate, length and engine of the chosen BitReps measurements file
+        :return: None
+        """
+        data = load_data(self.get_t2_file())
+        meta_data = get_meta_data(data)
+        bs, sw, er, nb = meta_data[0], meta_data[1], meta_data[2], meta_data[3]
+        if sw:
+            self.t2_stats_edit.setText("Models can only be generated for measurements without a sliding window.")
+            return
+
+        self.t2_gen_btn.setEnabled(False)
+        self.t2_prog.setValue(0)
+        self.worker = ModelWorker(bs, er, nb, get_engine(data))
+        self.worker.progress.connect(self.t2_prog.setValue)
+        self.worker.done.connect(self.generated)
+        self.worker.failed.connect(self.generated_failed)
+        self.worker.start()
+
+    def generated(self, model_path):
+        """
+        Select a freshly generated model
+        :param model_path: Path of the generated model
+        :return: None
+        """
+        self.set_t2_model(model_path)
+        self.t2_gen_btn.setEnabled(True)
+
+    def generated_failed(self, message):
+        """
+        Report a model which could not be generated
+        :param message: Reason for the failure
+        :return: None
+        """
+        self.t2_stats_edit.setText(message)
+        self.t2_gen_btn.setEnabled(True)
+
     def write_results(self):
         """
         Write the results of automated analysis to a .txt file
@@ -340,12 +427,17 @@ class BitReps(QWidget):
         Perform BitReps measurements for the selected file using the user-specified parameters
         :return: None
         """
+        blocksize = int(self.get_t1_size())
+        sliding = self.get_t1_slide()
+        segment_size = bytes_to_blocks(int(self.get_t1_seg()), blocksize, sliding) if self.get_t1_seg() else 0
+
         bitreps_measure(
             self.get_t1_file(),
-            int(self.get_t1_size()),
+            blocksize,
             self.t1_prog,
-            self.get_t1_slide(),
-            float(self.get_t1_err())
+            sliding,
+            float(self.get_t1_err()),
+            segment_size
         )
 
     def get_file(self):
@@ -361,9 +453,18 @@ class BitReps(QWidget):
         return response[0]
 
 
-if __name__ == "__main__":
+def main(argv):
+    """
+    Launch the BitReps GUI
+    :param argv: Command line arguments
+    :return: Exit code of the Qt application
+    """
     dir_setup()
-    app = QApplication(sys.argv)
+    app = QApplication(argv)
     bitReps = BitReps()
     bitReps.show()
-    sys.exit(app.exec_())
+    return app.exec_()
+
+
+if __name__ == "__main__":
+    sys.exit(main(sys.argv))
@@ -0,0 +1,225 @@
+from concurrent.futures import ProcessPoolExecutor
+from processor import chi_from_counts
+from core import ENGINES, MODEL_DIR, POSSIBLE_BLKS, STREAM_BLOCKS, load_backend, stream_blocks, track_hits
+from multiprocessing import get_context
+from collections import Counter
+import hashlib
+import json
+import os
+
+
+SOURCES = ["urandom", "csprng"]                         # Supported baseline generators
+DEFAULT_RUNS = 100                                      # Default number of baseline runs per model
+MIN_BUCKET = 5                                          # Minimum expected frequency of a histogram bucket
+
+
+def seeded_reader(seed):
+    """
+    Build a reproducible CSPRNG byte stream (SHAKE-256 in counter mode) from a seed
+    :param seed: Integer seed for the stream
+    :return: Callable taking a number of bytes and returning that many pseudorandom bytes
+    """
+    state = {"counter": 0}
+    key = seed.to_bytes(16, "big")
+
+    def read(n):
+        block = hashlib.shake_256(key + state["counter"].to_bytes(8, "big")).digest(n)
+        state["counter"] += 1
+        return block
+    return read
+
+
+def count_occurrences(read, num_blocks, blocksize):
+    """
+    Count how many distinct blocks occur once, twice and so on, by sorting the blocks rather than passing them through
+    an engine one at a time. Blocks are read straight into a single preallocated array which is sorted in place, and
+    runs of equal blocks are then counted a chunk at a time, so memory stays at about one copy of the blocks.
+    :param read: Callable taking a number of bytes and returning that many bytes
+    :param num_blocks: Number of blocks to read
+    :param blocksize: Blocksize of the baseline run
+    :return: Histogram mapping number of occurrences to the number of distinct blocks occurring that many times
+    """
+    import numpy as np
+
+    width = int(blocksize / 8)
+    # Words up to 64 bits sort far faster as integers than as raw bytes
+    blocks = np.empty(num_blocks, dtype=">u%d" % width if blocksize <= 64 else "V%d" % width)
+    for start in range(0, num_blocks, STREAM_BLOCKS):   # Read in the same chunks as stream_blocks, so seeds agree
+        count = min(STREAM_BLOCKS, num_blocks - start)
+        blocks[start:start + count] = np.frombuffer(read(count * width), dtype=blocks.dtype)
+    blocks.sort()
+
+    occurrences = Counter()
+    pending = 0                                         # Length of the run of equal blocks ending the previous chunk
+    for start in range(0, num_blocks, STREAM_BLOCKS):
+        chunk = blocks[start:start + STREAM_BLOCKS]
+        ends = np.flatnonzero(chunk[1:] != chunk[:-1])
+        runs = np.diff(ends, prepend=-1, append=len(chunk) - 1)
+        if pending and chunk[0] == blocks[start - 1]:
+            runs[0] += pending
+        elif pending:
+            occurrences[pending] += 1
+        lengths, counts = np.unique(runs[:-1], return_counts=True)
+        occurrences.update(dict(zip(lengths.tolist(), counts.tolist())))
+        pending = int(runs[-1])
+    if pending:
+        occurrences[pending] += 1
+    return occurrences
+
+
+def draw_histogram(occurrences, fp_rate, rng=None):
+    """
+    Derive the repetition histogram an engine would produce from the occurrences of each distinct block. Without a false
+    positive, a block occurring c times is repeated c - 1 times. If its first occurrence is a false positive, the engine
+    never stores it, so all c occurrences count as repetitions; this happens with the engine's average false positive
+    rate, as averaged across insertion time by track_hits.
+    :param occurrences: Histogram returned by count_occurrences
+    :param fp_rate: Average false positive rate of the engine
+    :param rng: numpy random Generator used to draw false positives (unused if fp_rate is 0)
+    :return: Histogram mapping number of repetitions to the number of blocks repeating that many times
+    """
+    hist = Counter()
+    for c, num in occurrences.items():
+        fps = int(rng.binomial(num, fp_rate)) if fp_rate else 0
+        if c > 1 and num > fps:
+            hist[c - 1] += num - fps
+        if fps:
+            hist[c] += fps
+    return hist
+
+
+def count_exact(read, num_blocks, blocksize):
+    """
+    Determine the repetition histogram the exact engine would produce
+    :param read: Callable taking a number of bytes and returning that many bytes
+    :param num_blocks: Number of blocks to read
+    :param blocksize: Blocksize of the baseline run
+    :return: Histogram mapping number of repetitions to the number of blocks repeating that many times
+    """
+    return draw_histogram(count_occurrences(read, num_blocks, blocksize), 0)
+
+
+def baseline_run(job):
+    """
+    Perform a single baseline BitReps measurement over freshly generated random data. Engines able to report their
+    average false positive rate (mean_fpr) are simulated from sorted block counts, as random data gives them random
+    false positives; any other engine is passed every block.
+    :param job: Tuple of (source, seed, num_blocks, blocksize, err_rate, engine)
+    :return: Histogram mapping number of repetitions to the number of blocks repeating that many times
+    """
+    import numpy as np
+
+    source, seed, num_blocks, blocksize, err_rate, engine = job
+    read = os.urandom if source == "urandom" else seeded_reader(seed)
+    engine_cls = load_backend(ENGINES, engine)
+    if hasattr(engine_cls, "mean_fpr"):
+        rng = np.random.default_rng(seed if source == "csprng" else None)
+        return draw_histogram(count_occurrences(read, num_blocks, blocksize),
+                              engine_cls.mean_fpr(num_blocks, err_rate), rng)
+    blocks = stream_blocks(read, num_blocks, blocksize)
+    hits, _, _ = track_hits(blocks, num_blocks, err_rate, blocksize, engine=engine, track_fpr=False)
+    return Counter(v["num_reps"] for v in hits.values())
+
+
+def expected_histogram(totals, runs):
+    """
+    Average summed histograms across runs, dropping buckets expected fewer than MIN_BUCKET times (as in trim_expected)
+    :param totals: Histogram summed across runs
+    :param runs: Number of runs summed
+    :return: Expected histogram
+    """
+    expected = {}
+    for k, v in totals.items():
+        mean = v / runs
+        if mean >= MIN_BUCKET:
+            expected[k] = mean
+    return expected
+
+
+def aggregate_runs(histograms):
+    """
+    Combine the histograms of many baseline runs into an expected histogram and a null chi-square distribution. Each
+    run is scored against the expected histogram of all other runs (leave-one-out), so that, like an input under
+    analysis, it never contributes to its own expectation.
+    :param histograms: List of histograms produced by baseline_run (at least two)
+    :return: (Expected histogram of all runs, sorted chi-square values of each run against the other runs)
+    """
+    totals = Counter()
+    for hist in histograms:
+        totals.update(hist)
+
+    null_chi = []
+    for hist in histograms:
+        others = totals.copy()
+        others.subtract(hist)
+        null_chi.append(chi_from_counts(hist, expected_histogram(others, len(histograms) - 1))[0])
+
+    return expected_histogram(totals, len(histograms)), sorted(null_chi)
+
+
+def get_model_path(source, num_blocks, blocksize, err_rate, engine):
+    """
+    Determine where the model for the given parameters is stored
+    :param source: Baseline generator
+    :param num_blocks: Number of blocks per baseline run
+    :param blocksize: Blocksize of the model
+    :param err_rate: Bloom filter error rate of the model
+    :param engine: Engine of the model
+    :return: Path of the model file
+    """
+    return os.path.join(MODEL_DIR, "model-%s-%s-%s-%s-%s-False.json" % (
+        source, engine, num_blocks, blocksize, str(err_rate).replace(".", "_")))
+
+
+def generate_model(blocksize, err_rate, num_blocks, runs=DEFAULT_RUNS, source="urandom", seed=0, workers=None,
+                   progress=None, engine="bloom"):
+    """
+    Run many independent baseline measurements in parallel and write the resulting model to MODEL_DIR
+    :param blocksize: Blocksize for the baseline measurements
+    :param err_rate: Bloom filter error rate for the baseline measurements
+    :param num_blocks: Number of blocks per baseline run (should match the inputs the model will be used against)
+    :param runs: Number of baseline runs
+    :param source: Baseline generator, "urandom" or "csprng"
+    :param seed: First seed used by the "csprng" source, run i uses seed + i
+    :param workers: Number of worker processes (defaults to the number of CPUs)
+    :param progress: Optional callable receiving the number of completed runs
+    :param engine: Name of the engine in ENGINES (should match the measurements the model will be used against)
+    :return: Path of the written model file
+    """
+    if blocksize not in POSSIBLE_BLKS:
+        raise ValueError("Invalid blocksize! Must be one of %s." % POSSIBLE_BLKS)
+    if source not in SOURCES:
+        raise ValueError("Invalid source! Must be one of %s." % SOURCES)
+    if runs < 2:
+        raise ValueError("Invalid number of runs! At least 2 are needed for a null distribution.")
+
+    jobs = [(source, seed + i, num_blocks, blocksize, err_rate, engine) for i in range(runs)]
+    histograms = []
+    # Spawn rather than fork workers, as the GUI generates models from a background thread
+    with ProcessPoolExecutor(max_workers=workers, mp_context=get_context("spawn")) as pool:
+        for hist in pool.map(baseline_run, jobs):
+            histograms.append(hist)
+            if progress is not None:
+                progress(len(histograms))
+
+    expected, null_chi = aggregate_runs(histograms)
+
+    model = {
+        "blocksize": blocksize,
+        "sliding": False,
+        "err_rate": err_rate,
+        "engine": engine,
+        "num_blocks": num_blocks,
+        "source": source,
+        "seed": seed if source == "csprng" else None,
+        "runs": runs,
+        "expected": expected,
+        "null_chi": null_chi
+    }
+
+    os.makedirs(MODEL_DIR, exist_ok=True)
+    model_path = get_model_path(source, num_blocks, blocksize, err_rate, engine)
+    with open(model_path, "w+") as of:
+        json.dump(model, of, indent=2)
+
+    return model_path
@@ -1,11 +1,12 @@
 from collections import Counter
-from main import MODEL_DIR
+from core import MODEL_DIR
 from decimal import *
 import json
 import os
 
 
 EXPECTED_PATH = os.path.join(MODEL_DIR, "urandom100M-32-1e-05-False.json")
+MODEL_PARAMS = ["blocksize", "sliding", "err_rate", "num_blocks"]  # Parameters a model must share with its input
 
 
 def custom_chi(obs, exp):
@@ -64,14 +65,61 @@ def get_exp_dupes(num_blocks, blocksize):
         return round(num_blocks - (x * (1 - (1 - Decimal(1 / x)) ** n)))
 
 
+def load_data(inputfile):
+    """
+    Read BitReps JSON output (or a model file) once, so that it can be shared by the functions analysing it
+    :param inputfile: File path of JSON output, or its already loaded contents
+    :return: Dictionary of the JSON output
+    """
+    if isinstance(inputfile, dict):
+        return inputfile
+    with open(inputfile) as f:
+        return json.load(f)
+
+
+def get_segment_profile(inputfile):
+    """
+    Build the per-segment repetition profile recorded by a segmented BitReps measurement, suitable for plotting
+    against the block index to locate regions of the input where repetition departs from expectation
+    :param inputfile: File path of JSON output, or its loaded contents
+    :return: Array with one row per segment and columns (end block, new repetitions, cumulative hits, cumulative
+    expected hits, ratio), where expected hits are genuine duplicates plus false positives and ratio is NaN until the
+    first hit. Empty if the measurement was not segmented
+    """
+    import numpy as np                      # Deferred, summarise only builds profiles for segmented measurements
+
+    data = load_data(inputfile)
+    rows = []
+    for seg in data.get("segments", []):
+        cum_exp = get_exp_dupes(seg["end"], data["blocksize"]) + round(seg["cum_fps"])
+        ratio = get_ratio(seg["cum_hits"], cum_exp) if seg["cum_hits"] else np.nan
+        rows.append((seg["end"], seg["new_reps"], seg["cum_hits"], cum_exp, ratio))
+    return np.array(rows, dtype=float).reshape(-1, 5)
+
+
+def get_worst_segment(profile):
+    """
+    Determine the segment whose new repetitions most exceed those expected within it
+    :param profile: Segment profile returned by get_segment_profile
+    :return: "start-end (observed, expected)" for the worst segment, or an empty string if there are no segments
+    """
+    import numpy as np
+
+    if not len(profile):
+        return ""
+    starts = np.concatenate(([0], profile[:-1, 0]))
+    exp_new = np.diff(profile[:, 3], prepend=0)
+    worst = int(np.argmax(profile[:, 1] - exp_new))
+    return "%d-%d (%d, %d)" % (starts[worst], profile[worst, 0], profile[worst, 1], exp_new[worst])
+
+
 def get_highest_rep(inputfile):
     """
     Determine the highest individually-repeating block within the output
-    :param inputfile: File path of JSON output
+    :param inputfile: File path of JSON output, or its loaded contents
     :return: The number of times that the maximally-repeating block within the output occurs
     """
-    with open(inputfile) as f:
-        data = json.load(f)
+    data = load_data(inputfile)
 
     current_max = 0
     block = 0
@@ -85,11 +133,10 @@ def get_highest_rep(inputfile):
 def get_meta_data(inputfile):
     """
     Read BitReps JSON output and obtain metadata relating to blocksize, window type and error rate
-    :param inputfile: BitReps JSON output supplied by user
+    :param inputfile: BitReps JSON output supplied by user, or its loaded contents
     :return: A tuple of (blocksize, sliding and err_rate)
     """
-    with open(inputfile) as f:
-        data = json.load(f)
+    data = load_data(inputfile)
     blocksize = data["blocksize"]
     sliding = data["sliding"]
     err_rate = data["err_rate"]
@@ -99,16 +146,23 @@ def get_meta_data(inputfile):
     return blocksize, sliding, err_rate, num_blocks, obs_hits, avg_err_rate
 
 
+def get_engine(inputfile):
+    """
+    Read BitReps JSON output and obtain the engine used for the measurement
+    :param inputfile: BitReps JSON output supplied by user, or its loaded contents
+    :return: Name of the engine (measurements predating engines always used the bloom filter)
+    """
+    return load_data(inputfile).get("engine", "bloom")
+
+
 def get_distri(inputfile):
     """
     Obtain the distribution of repetitions from a BitReps JSON file to be used for later processing
-    :param inputfile: Path of BitReps JSON file
+    :param inputfile: Path of BitReps JSON file, or its loaded contents
     :return: A list of values representing the number of repetitions in a file
     """
     distri = []
-    with open(inputfile) as f:
-        data = json.load(f)
-    for k, v in data["hits"].items():
+    for k, v in load_data(inputfile)["hits"].items():
         distri.append(v["num_reps"])
     return distri
 
@@ -132,38 +186,121 @@ def trim_expected(distri):
     return trimmed_distri
 
 
+def chi_from_counts(count_obs, count_exp):
+    """
+    Align an observed repetition histogram with an expected one and calculate the chi-square value between them
+    :param count_obs: Mapping of number of repetitions to the number of blocks observed with that many repetitions
+    :param count_exp: Mapping of number of repetitions to the number of blocks expected with that many repetitions
+    :return: (Chi-square value, observed frequencies, expected frequencies)
+    """
+    chi_in_obs = []
+    chi_in_exp = []
+
+    for k, v in sorted(count_exp.items()):  # Only consider buckets which are in the expected distribution, using zero
+        chi_in_obs.append(count_obs.get(k, 0))  # where a bucket doesn't occur in the observed
+        chi_in_exp.append(v)
+
+    return custom_chi(chi_in_obs, chi_in_exp), chi_in_obs, chi_in_exp
+
+
+def get_p_value(chi, null_chi):
+    """
+    Determine the empirical significance of a chi-square value against a null distribution of chi-square values
+    obtained from baseline runs
+    :param chi: Chi-square value of the input under analysis
+    :param null_chi: Chi-square values of the baseline runs
+    :return: Proportion of baseline runs at least as extreme as the input (with add-one smoothing)
+    """
+    extreme = sum(1 for val in null_chi if val >= chi)
+    return (extreme + 1) / (len(null_chi) + 1)
+
+
+def load_expected(exp_path):
+    """
+    Read an expected repetition histogram from either a generated model or a single baseline BitReps JSON file
+    :param exp_path: Path of a model file or BitReps JSON file, or its loaded contents
+    :return: (Expected histogram, null chi-square distribution or None if the file carries no null distribution)
+    """
+    data = load_data(exp_path)
+
+    if "expected" in data:                  # Generated model: histogram is already averaged and trimmed
+        return {int(k): v for k, v in data["expected"].items()}, data["null_chi"]
+
+    return Counter(trim_expected(get_distri(data))), None
+
+
+def check_model(data, exp_path):
+    """
+    Ensure a generated model was built with the same parameters as the BitReps measurement it is compared against, as
+    a model for any other blocksize, error rate, length or engine yields a meaningless p-value. Single baseline BitReps
+    files carry no null distribution and are not checked.
+    :param data: Path of a JSON BitReps file to analyse, or its loaded contents
+    :param exp_path: Path of a model file or JSON BitReps file representing the expected distribution, or its contents
+    :return: None
+    """
+    measured = load_data(data)
+    model = load_data(exp_path)
+
+    if "expected" not in model:
+        return
+
+    mismatched = ["%s (input %s, model %s)" % (k, measured[k], model[k]) for k in MODEL_PARAMS
+                  if measured[k] != model[k]]
+    engines = measured.get("engine", "bloom"), model.get("engine", "bloom")
+    if engines[0] != engines[1]:
+        mismatched.append("engine (input %s, model %s)" % engines)
+    if mismatched:
+        raise ValueError("Model does not match input! Differing parameters: %s." % ", ".join(mismatched))
+
+
 def calc_chi(data, exp_path):
     """
     Using the model file at exp_path as an expected distribution, calculate the chi-square value for a given repetition
     distribution
-    :param data: Path of a JSON BitReps file to analyse
-    :param exp_path: Path of a JSON BitReps file representing the expected chi-square distribution
-    :return: (Chi-square value, observed distribution, expected distribution)
+    :param data: Path of a JSON BitReps file to analyse, or its loaded contents
+    :param exp_path: Path of a model file or JSON BitReps file representing the expected distribution, or its contents
+    :return: (Chi-square value, observed distribution, expected distribution, p-value or None if unavailable)
     """
-    exp_vals = get_distri(exp_path)
-    obs_vals = get_distri(data)
-    trimmed_expected = trim_expected(exp_vals)
+    data = load_data(data)
+    model = load_data(exp_path)
+    check_model(data, model)
+    count_exp, null_chi = load_expected(model)
+    count_obs = Counter(get_distri(data))
 
-    fixed_obs = []                          # Only consider observed values which are in the expected distribution
-    for val in obs_vals:
-        if val in trimmed_expected:
-            fixed_obs.append(val)
+    chi, chi_in_obs, chi_in_exp = chi_from_counts(count_obs, count_exp)
+    p_value = get_p_value(chi, null_chi) if null_chi else None
 
-    count_obs = Counter(fixed_obs)
-    count_exp = Counter(trimmed_expected)
+    return chi, chi_in_obs, chi_in_exp, p_value
 
-    for k, v in count_exp.items():          # If a value in the expected distribution doesn't occur in the observed,
-        if k not in count_obs:              # append a zero to the observed to ensure the same number of buckets
-            count_obs[k] = 0
 
-    chi_in_obs = []
-    chi_in_exp = []
-
-    for k, v in sorted(count_obs.items()):  # Convert distributions to lists of their frequencies for the chi-square
-        chi_in_obs.append(v)                # function
-    for k, v in sorted(count_exp.items()):
-        chi_in_exp.append(v)
+def summarise(inputfile, exp_path):
+    """
+    Perform the full statistical analysis of a BitReps JSON file, as shown by the frontends
+    :param inputfile: Path of a JSON BitReps file to analyse
+    :param exp_path: Path of a model file or JSON BitReps file representing the expected distribution
+    :return: Dictionary of metadata and analysis results
+    """
+    data = load_data(inputfile)                 # Hit maps of large captures are big, so parse them only once
+    bs, sw, er, nb, oh, avger = get_meta_data(data)
 
-    chi = custom_chi(chi_in_obs, chi_in_exp)
+    # Obtain expected false positives, duplicates, highest rep, ratio
+    exp_fps = get_exp_fps(nb, avger)
+    exp_dupes = get_exp_dupes(nb, bs)
+    chi, chi_in_obs, chi_in_exp, p_value = calc_chi(data, exp_path)
+    segmented = data.get("segment_size") and data.get("segments")
 
-    return chi, chi_in_obs, chi_in_exp
+    return {
+        "blocksize": bs,
+        "sliding": sw,
+        "err_rate": er,
+        "exp": chi_in_exp,
+        "obs": chi_in_obs,
+        "chi": chi,
+        "p_value": p_value,
+        "exp_fps": exp_fps,
+        "exp_dupes": exp_dupes,
+        "obs_hits": oh,
+        "ratio": get_ratio(oh, (exp_fps + exp_dupes)),
+        "highest_rep": get_highest_rep(data),
+        "worst_segment": get_worst_segment(get_segment_profile(data)) if segmented else ""
+    }
@@ -0,0 +1,103 @@
+from core import ENGINES, bitreps_measure, load_backend, track_hits
+from model import seeded_reader
+import subprocess
+import pytest
+import json
+import sys
+import os
+
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+OPTIONAL = ["bloom_filter2", "tqdm", "numpy", "PyQt5", "engines"]
+
+
+class RecordingBar:
+    def __init__(self):
+        self.values = []
+
+    def setValue(self, value):
+        self.values.append(value)
+
+
+def test_headless_import_loads_no_optional_dependency(workdir):
+    measured = {"hits": {"5": {"num_reps": 1, "bin_rep": "101"}}, "blocksize": 32, "sliding": False,
+                "err_rate": 0.001, "engine": "exact", "num_blocks": 10, "avg_err_rate": 0, "segment_size": 0,
+                "segments": []}
+    with open("measured.json", "w") as f:
+        json.dump(measured, f)
+
+    code = "import sys, core, processor; processor.summarise('measured.json', 'measured.json'); " \
+           "print(','.join(m for m in %r if m in sys.modules))" % OPTIONAL
+    result = subprocess.run([sys.executable, "-c", code], cwd=str(workdir), capture_output=True, text=True, check=True,
+                            env=dict(os.environ, PYTHONPATH=ROOT))
+    assert result.stdout.strip() == ""
+
+
+def test_main_reexports_core():
+    import core
+    import main
+    assert main.bitreps_measure is core.bitreps_measure
+    assert main.MODEL_DIR == core.MODEL_DIR
+    assert main.POSSIBLE_BLKS is core.POSSIBLE_BLKS
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match="Unknown backend"):
+        load_backend(ENGINES, "missing")
+
+
+@pytest.mark.parametrize("engine", ["exact", "sketch"])
+def test_engines_find_repetitions(engine):
+    blocks = [5, 9, 5, 7, 9, 5]
+    hits, afpr, _ = track_hits(blocks, len(blocks), 0.001, 32, engine=engine)
+    assert {k: v["num_reps"] for k, v in hits.items()} == {5: 2, 9: 1}
+    assert hits[5]["indices"] == [2, 5]
+    assert 0 <= afpr <= 0.001
+
+
+def test_sketch_fpr_matches_error_rate():
+    sketch = load_backend(ENGINES, "sketch")(10 ** 6, 0.01)
+    assert sketch.current_fpr(1) == 0
+    assert 0.0025 < sketch.current_fpr(10 ** 6) <= 0.01
+
+
+def test_sketch_separates_blocks_equal_modulo_hash_prime():
+    sketch = load_backend(ENGINES, "sketch")(10 ** 6, 0.01)
+    blocks = [6 + i * (2 ** 61 - 1) for i in range(50)]
+    for block in blocks:
+        assert block not in sketch
+        sketch.add(block)
+
+
+def test_measure_small_input_with_progress_bar(workdir):
+    with open("input.bin", "wb") as f:
+        f.write(seeded_reader(1)(50 * 4))           # Fewer than 100 blocks
+    bar = RecordingBar()
+    bitreps_measure("input.bin", 32, bar, False, 0.001, engine="exact")
+
+    assert bar.values[-1] == 100
+    with open(os.path.join("output", "input-exact-32-0_001-False.json")) as f:
+        assert json.load(f)["num_blocks"] == 50
+
+
+def test_measurements_with_different_engines_kept_apart(workdir):
+    with open("input.bin", "wb") as f:
+        f.write(seeded_reader(3)(400))
+    for engine in ["exact", "sketch"]:
+        bitreps_measure("input.bin", 32, None, False, 0.001, engine=engine)
+
+    for engine in ["exact", "sketch"]:
+        with open(os.path.join("output", "input-%s-32-0_001-False.json" % engine)) as f:
+            assert json.load(f)["engine"] == engine
+
+
+def test_measure_sliding_window(workdir):
+    pair = seeded_reader(2)(8)                      # One pair of 32-bit blocks, giving 32 windows
+    with open("input.bin", "wb") as f:
+        f.write(pair * 2)
+    bitreps_measure("input.bin", 32, None, True, 0.001, engine="exact")
+
+    with open(os.path.join("output", "input-exact-32-0_001-True.json")) as f:
+        data = json.load(f)
+    assert data["num_blocks"] == 64
+    assert sum(v["num_reps"] for v in data["hits"].values()) >= 32
@@ -0,0 +1,77 @@
+from corpus import FANOUT, add_file, load_manifest, query_file
+from model import seeded_reader
+import numpy as np
+import pytest
+import os
+
+
+def write(path, data):
+    with open(path, "wb") as f:
+        f.write(data)
+    return os.path.abspath(path)
+
+
+def test_shared_segment_exact_offsets(workdir):
+    a = seeded_reader(1)(100 * 16)                  # 100 128-bit blocks
+    a_path = write("a.bin", a)
+    write("b.bin", seeded_reader(2)(20 * 16) + a[30 * 16:50 * 16] + seeded_reader(3)(10 * 16))
+
+    assert add_file("a.bin", 128) == {}
+    collisions = add_file("b.bin", 128)
+    assert list(collisions) == [a_path]
+    assert collisions[a_path].tolist() == [[20, 30, 20]]
+
+
+@pytest.mark.parametrize("blocksize", [64, 128])
+def test_collisions_across_chunks_and_compacted_runs(workdir, blocksize):
+    width = blocksize // 8
+    a = seeded_reader(4)(200 * width)               # 200 blocks, stored as 25 runs of 8 before compaction
+    a_path = write("a.bin", a)
+    b_path = write("b.bin", seeded_reader(5)(3 * width) + a[10 * width:30 * width] + a[150 * width:190 * width])
+
+    add_file("a.bin", blocksize, chunk_blocks=8)
+    levels = [run["level"] for run in load_manifest(blocksize)["runs"]]
+    assert all(levels.count(level) < FANOUT for level in levels)
+    assert sum(run["num_blocks"] for run in load_manifest(blocksize)["runs"]) == 200
+
+    collisions = add_file("b.bin", blocksize, chunk_blocks=7)
+    assert collisions[a_path].tolist() == [[3, 10, 20], [23, 150, 40]]
+
+    # b itself is now indexed, so querying a finds b's copies of its blocks
+    assert query_file("a.bin", blocksize, chunk_blocks=16)[b_path].tolist() == [[10, 3, 20], [150, 23, 40]]
+
+
+def test_repeated_blocks_report_every_earlier_offset(workdir):
+    block = seeded_reader(6)(16)
+    a_path = write("a.bin", block * 3)
+    write("b.bin", block)
+
+    add_file("a.bin", 128)
+    assert query_file("b.bin", 128)[a_path].tolist() == [[0, 0, 1], [0, 1, 1], [0, 2, 1]]
+
+
+def test_duplicate_add_raises(workdir):
+    write("a.bin", seeded_reader(7)(160))
+    add_file("a.bin", 128)
+    with pytest.raises(ValueError, match="already in"):
+        add_file("a.bin", 128)
+
+
+def test_query_empty_index(workdir):
+    write("a.bin", seeded_reader(8)(160))
+    assert query_file("a.bin", 128) == {}
+    assert not os.path.exists(os.path.join("index", "128", "manifest.json"))
+
+
+def test_invalid_blocksize_and_chance_collisions(workdir):
+    write("a.bin", seeded_reader(9)(100))
+    write("b.bin", seeded_reader(10)(100))
+    with pytest.raises(ValueError, match="Invalid blocksize"):
+        query_file("a.bin", 24)
+
+    add_file("a.bin", 8)                            # Empty index, so nothing to collide with by chance
+    with pytest.raises(ValueError, match="chance collisions"):
+        query_file("b.bin", 8)
+    with pytest.warns(UserWarning, match="truncated"):
+        collisions = query_file("b.bin", 8, force=True, limit=5)
+    assert sum(int(np.sum(segments[:, 2])) for segments in collisions.values()) <= 5
@@ -0,0 +1,81 @@
+from collections import Counter
+from core import bitreps_measure, stream_blocks, track_hits
+from model import aggregate_runs, baseline_run, count_exact, count_occurrences, draw_histogram, expected_histogram, \
+    generate_model, get_model_path, seeded_reader
+from processor import calc_chi, chi_from_counts
+import pytest
+import os
+
+
+def test_count_exact_matches_engine():
+    hits, _, _ = track_hits(stream_blocks(seeded_reader(3), 20000, 16), 20000, 0, 16, engine="exact")
+    assert count_exact(seeded_reader(3), 20000, 16) == Counter(v["num_reps"] for v in hits.values())
+
+
+def test_count_occurrences_across_chunks(monkeypatch):
+    data = seeded_reader(4)(2 * 5000)
+    stream = iter([data[i:i + 14] for i in range(0, len(data), 14)])
+    monkeypatch.setattr("model.STREAM_BLOCKS", 7)    # Runs of equal blocks straddle many chunks
+
+    occurrences = count_occurrences(lambda n: next(stream), 5000, 16)
+    assert sum(c * num for c, num in occurrences.items()) == 5000
+    assert draw_histogram(occurrences, 0) == Counter(
+        v["num_reps"] for v in track_hits(stream_blocks(seeded_reader(4), 5000, 16), 5000, 0, 16,
+                                          engine="exact")[0].values())
+
+
+def test_bloom_baseline_matches_engine():
+    pytest.importorskip("bloom_filter2")
+    num_blocks, err_rate = 20000, 0.05              # Mostly false positives, as 32-bit duplicates are rare here
+    measured = track_hits(stream_blocks(seeded_reader(5), num_blocks, 32), num_blocks, err_rate, 32)[0]
+    simulated = baseline_run(("csprng", 5, num_blocks, 32, err_rate, "bloom"))
+
+    assert abs(sum(simulated.values()) - len(measured)) < 75   # Roughly 225 false positives either way
+    assert set(simulated) == {1}
+
+
+def test_bloom_engine_size_matches_filter():
+    pytest.importorskip("bloom_filter2")
+    from engines import BloomEngine
+    engine = BloomEngine(10 ** 5, 0.001)
+    assert BloomEngine.get_size(10 ** 5, 0.001) == (engine.bf.num_probes_k, engine.bf.num_bits_m)
+
+
+def test_aggregate_runs_leave_one_out():
+    histograms = [Counter({1: 100, 2: 10}), Counter({1: 120, 2: 6}), Counter({1: 90, 2: 14})]
+    expected, null_chi = aggregate_runs(histograms)
+
+    assert expected == {1: 310 / 3, 2: 10}
+    others = histograms[1] + histograms[2]
+    held_out = chi_from_counts(histograms[0], expected_histogram(others, 2))[0]
+    assert held_out in null_chi
+    assert chi_from_counts(histograms[0], expected)[0] not in null_chi
+
+
+def test_model_p_value_and_mismatch(workdir):
+    with open("input.bin", "wb") as f:
+        f.write(seeded_reader(99)(8000))
+    bitreps_measure("input.bin", 16, None, False, 0.001, engine="exact")
+    measured = os.path.join("output", "input-exact-16-0_001-False.json")
+
+    model_path = generate_model(16, 0.001, 4000, runs=8, source="csprng", workers=2, engine="exact")
+    p_value = calc_chi(measured, model_path)[3]
+    assert 0 < p_value <= 1
+
+    other_path = generate_model(16, 0.001, 3000, runs=2, source="csprng", workers=1, engine="exact")
+    with pytest.raises(ValueError, match="num_blocks"):
+        calc_chi(measured, other_path)
+
+
+def test_bloom_model_p_value(workdir):
+    pytest.importorskip("bloom_filter2")
+    with open("input.bin", "wb") as f:
+        f.write(seeded_reader(98)(4 * 20000))
+    bitreps_measure("input.bin", 32, None, False, 0.05, engine="bloom")
+
+    model_path = generate_model(32, 0.05, 20000, runs=8, source="csprng", workers=2, engine="bloom")
+    assert 0 < calc_chi(os.path.join("output", "input-bloom-32-0_05-False.json"), model_path)[3] <= 1
+
+
+def test_model_path_includes_engine():
+    assert get_model_path("urandom", 100, 32, 0.001, "exact") != get_model_path("urandom", 100, 32, 0.001, "bloom")
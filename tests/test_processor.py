@@ -0,0 +1,36 @@
+from core import bitreps_measure, bytes_to_blocks, get_blocks, slide_blocks
+from model import seeded_reader
+from processor import get_segment_profile, get_worst_segment
+import os
+
+
+def test_segment_profile_flags_repeated_half(workdir):
+    first_half = seeded_reader(7)(4000)             # 1000 32-bit blocks
+    with open("input.bin", "wb") as f:
+        f.write(first_half + first_half)
+    bitreps_measure("input.bin", 32, None, False, 0.001, bytes_to_blocks(1000, 32), engine="exact")
+
+    profile = get_segment_profile(os.path.join("output", "input-exact-32-0_001-False.json"))
+    assert profile.shape == (8, 5)
+    assert profile[:4, 1].tolist() == [0, 0, 0, 0]
+    assert profile[4:, 1].tolist() == [250, 250, 250, 250]
+    assert profile[-1, 2] == 1000
+    assert get_worst_segment(profile) == "1000-1250 (250, 0)"
+
+
+def test_unsegmented_profile_is_empty(workdir):
+    with open("input.bin", "wb") as f:
+        f.write(seeded_reader(8)(400))
+    bitreps_measure("input.bin", 32, None, False, 0.001, engine="exact")
+
+    profile = get_segment_profile(os.path.join("output", "input-exact-32-0_001-False.json"))
+    assert profile.shape == (0, 5)
+    assert get_worst_segment(profile) == ""
+
+
+def test_sliding_segment_covers_requested_bytes(workdir):
+    with open("input.bin", "wb") as f:
+        f.write(seeded_reader(9)(16))               # Two pairs of 32-bit blocks
+    windows = slide_blocks(get_blocks("input.bin", 32), 32)
+    assert bytes_to_blocks(16, 32, True) == len(windows)
+    assert bytes_to_blocks(8, 32, True) == len(windows) / 2